@@ -0,0 +1,199 @@
+import hashlib
+import mimetypes
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from starlette.responses import FileResponse, Response
+
+load_dotenv()
+
+MEDIA_CACHE_ENABLED = os.getenv('MEDIA_CACHE_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', 'media_cache')
+MEDIA_CACHE_MAX_BYTES = int(os.getenv('MEDIA_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+MEDIA_CACHE_MAX_AGE = int(os.getenv('MEDIA_CACHE_MAX_AGE', 86400))
+
+# public_id -> {"path", "size", "etag", "media_type"}, least recently used first
+_cache_index: OrderedDict[str, dict] = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def _cache_key(public_id: str) -> str:
+    return hashlib.sha1(public_id.encode("utf-8")).hexdigest()
+
+
+def _make_entry(path: str) -> dict:
+    stat = os.stat(path)
+    return {
+        "path": path,
+        "size": stat.st_size,
+        "etag": f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"',
+        "media_type": mimetypes.guess_type(path)[0] or "application/octet-stream",
+    }
+
+
+def _remove_cached_file(path: str):
+    for stale_path in (path, f"{os.path.splitext(path)[0]}.public_id"):
+        try:
+            os.remove(stale_path)
+        except FileNotFoundError:
+            pass
+
+
+def _evict_until_fits(size: int):
+    global _cache_bytes
+    while _cache_index and _cache_bytes + size > MEDIA_CACHE_MAX_BYTES:
+        public_id, entry = _cache_index.popitem(last=False)
+        _cache_bytes -= entry["size"]
+        _remove_cached_file(entry["path"])
+        print(f"Evicted cached media: {public_id}")
+
+
+def load_media_cache():
+    """Rebuilds the in-memory index from the cache directory, oldest files first."""
+    global _cache_bytes
+    if not MEDIA_CACHE_ENABLED:
+        return
+    os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+
+    with _cache_lock:
+        _cache_index.clear()
+        _cache_bytes = 0
+        files = []
+        for name in os.listdir(MEDIA_CACHE_DIR):
+            path = os.path.join(MEDIA_CACHE_DIR, name)
+            if name.endswith(".public_id") or not os.path.isfile(path):
+                continue
+            id_path = f"{os.path.splitext(path)[0]}.public_id"
+            # Leftovers from an interrupted cache_media would otherwise use disk outside the size limit.
+            if name.endswith(".tmp") or not os.path.exists(id_path):
+                print(f"Removing orphaned cache file: {path}")
+                os.remove(path)
+                continue
+            try:
+                with open(id_path, "r") as f:
+                    files.append((os.path.getmtime(path), f.read(), path))
+            except OSError as e:
+                print(f"Could not read cache sidecar {id_path}: {e}")
+                _remove_cached_file(path)
+
+        for _, public_id, path in sorted(files):
+            entry = _make_entry(path)
+            old_entry = _cache_index.pop(public_id, None)
+            if old_entry:
+                # Same key under two extensions; keep the newer file.
+                _cache_bytes -= old_entry["size"]
+                os.remove(old_entry["path"])
+            _cache_index[public_id] = entry
+            _cache_bytes += entry["size"]
+        _evict_until_fits(0)
+
+    print(f"Loaded {len(_cache_index)} cached media files ({_cache_bytes} bytes)")
+
+
+def cache_media(public_id: str, source_path: str) -> bool:
+    """
+    Moves an already uploaded local file into the cache under public_id.
+    The file the upload was streamed to is adopted as-is, so no extra copy is made.
+    """
+    global _cache_bytes
+    if not MEDIA_CACHE_ENABLED:
+        return False
+
+    try:
+        size = os.path.getsize(source_path)
+        if size > MEDIA_CACHE_MAX_BYTES:
+            print(f"Not caching {public_id}: {size} bytes exceeds cache size")
+            return False
+
+        os.makedirs(MEDIA_CACHE_DIR, exist_ok=True)
+        key = _cache_key(public_id)
+        cache_path = os.path.join(MEDIA_CACHE_DIR, f"{key}{os.path.splitext(source_path)[1].lower()}")
+
+        # Move the file in before touching the index, so a failed move never evicts live entries.
+        # shutil.move falls back to copy + unlink when MEDIA_CACHE_DIR is on another filesystem;
+        # the final os.replace keeps readers of a previous version on their own inode.
+        tmp_path = f"{cache_path}.tmp"
+        try:
+            shutil.move(source_path, tmp_path)
+            os.replace(tmp_path, cache_path)
+            with open(os.path.join(MEDIA_CACHE_DIR, f"{key}.public_id"), "w") as f:
+                f.write(public_id)
+            entry = _make_entry(cache_path)
+        except Exception:
+            for partial_path in (tmp_path, cache_path):
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+            raise
+
+        with _cache_lock:
+            old_entry = _cache_index.pop(public_id, None)
+            if old_entry:
+                _cache_bytes -= old_entry["size"]
+                if old_entry["path"] != cache_path and os.path.exists(old_entry["path"]):
+                    # Same key, so only the media file goes; the .public_id sidecar is shared.
+                    os.remove(old_entry["path"])
+            _evict_until_fits(entry["size"])
+
+            _cache_index[public_id] = entry
+            _cache_bytes += entry["size"]
+
+        print(f"Cached media {public_id} at: {cache_path}")
+        return True
+
+    except Exception as e:
+        print(f"An unexpected error occurred while caching {public_id}: {e}")
+        return False
+
+
+def get_cached_media(public_id: str) -> dict | None:
+    if not MEDIA_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        entry = _cache_index.get(public_id)
+        if entry:
+            _cache_index.move_to_end(public_id)
+        return entry
+
+
+def drop_cached_media(public_id: str):
+    """Forgets a cache entry whose file has gone missing, so it stops counting against the cache size."""
+    global _cache_bytes
+    with _cache_lock:
+        entry = _cache_index.get(public_id)
+        if entry and not os.path.exists(entry["path"]):
+            del _cache_index[public_id]
+            _cache_bytes -= entry["size"]
+            _remove_cached_file(entry["path"])
+            print(f"Dropped stale cached media: {public_id}")
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison as RFC 9110 requires for If-None-Match: W/ prefixes are ignored."""
+    if if_none_match.strip() == "*":
+        return True
+    strip_weak = lambda tag: tag.strip().removeprefix("W/")
+    return strip_weak(etag) in [strip_weak(tag) for tag in if_none_match.split(",")]
+
+
+def build_media_response(entry: dict, request_headers) -> Response | None:
+    """Builds the response for a cache hit, or returns None if the cached file has gone away."""
+    headers = {
+        "ETag": entry["etag"],
+        "Cache-Control": f"public, max-age={MEDIA_CACHE_MAX_AGE}",
+    }
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, entry["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        stat_result = os.stat(entry["path"])
+    except FileNotFoundError:
+        return None
+
+    # FileResponse handles Range/If-Range/416 and HEAD, and uses http.response.pathsend
+    # when the server offers it.
+    return FileResponse(entry["path"], headers=headers, media_type=entry["media_type"], stat_result=stat_result)
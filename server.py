@@ -5,14 +5,25 @@ import json
 from typing import List, Optional
 from image_url import upload_image_to_cloudinary # Keep this for image uploads
 from video_url import upload_video_to_cloudinary # Import the new video upload function
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import JSONResponse
+from video_compress import compress_video_in_pool, shutdown_compression_pool, DEFAULT_TARGET_BITRATE_KBPS, DEFAULT_MAX_HEIGHT
+from media_cache import load_media_cache, cache_media, get_cached_media, drop_cached_media, build_media_response
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, RedirectResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import uvicorn
 import datetime
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    load_media_url_index()
+    load_media_cache()
+    yield
+    shutdown_compression_pool()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -28,6 +39,23 @@ PUBLIC_VIDEOS_DIR = "public_videos" # New directory for videos
 IMAGE_METADATA_DIR = "image_metadata"
 VIDEO_METADATA_DIR = "video_metadata" # New directory for video metadata
 
+# public_id -> stored Cloudinary URL, used to redirect /media/ cache misses
+media_url_index = {}
+
+def load_media_url_index():
+    for metadata_dir in (IMAGE_METADATA_DIR, VIDEO_METADATA_DIR):
+        if not os.path.isdir(metadata_dir):
+            continue
+        for metadata_filename in os.listdir(metadata_dir):
+            if not metadata_filename.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(metadata_dir, metadata_filename), "r") as f:
+                    metadata_content = json.load(f)
+                media_url_index[metadata_content["public_id"]] = metadata_content["url"]
+            except Exception as e:
+                print(f"Could not read metadata file {metadata_filename}: {e}")
+
 def save_metadata(filename: str, public_id: str, url: str, original_filename: str, metadata_dir: str):
     os.makedirs(metadata_dir, exist_ok=True)
     metadata_filename = f"{os.path.splitext(filename)[0]}.json"
@@ -42,6 +70,7 @@ def save_metadata(filename: str, public_id: str, url: str, original_filename: st
 
     with open(metadata_path, "w") as f:
         json.dump(metadata_content, f, indent=4)
+    media_url_index[public_id] = url
     print(f"Metadata saved to: {metadata_path}")
 
 
@@ -72,13 +101,15 @@ async def upload_image_endpoint(
 
         if uploaded_url and public_id:
             save_metadata(new_filename_with_ext, public_id, uploaded_url, original_filename, IMAGE_METADATA_DIR)
+            cached = await run_in_threadpool(cache_media, public_id, local_file_path)
 
             return JSONResponse(status_code=200, content={
                 "message": "Image uploaded successfully",
                 "url": uploaded_url,
                 "public_id": public_id,
                 "local_path": local_file_path,
-                "metadata_saved": True
+                "metadata_saved": True,
+                "cached": cached
             })
         else:
             raise HTTPException(status_code=500, detail="Cloudinary image upload failed: Check server logs for details.")
@@ -95,9 +126,16 @@ async def upload_image_endpoint(
 @app.post("/upload-video/") # New endpoint for video uploads
 async def upload_video_endpoint(
     file: UploadFile = File(...),
+    compress: bool = Form(False),
+    target_bitrate_kbps: int = Form(DEFAULT_TARGET_BITRATE_KBPS),
+    max_height: int = Form(DEFAULT_MAX_HEIGHT),
 ):
     local_file_path = None
+    compressed_file_path = None
     try:
+        if compress and (target_bitrate_kbps <= 0 or max_height <= 0):
+            raise HTTPException(status_code=400, detail="target_bitrate_kbps and max_height must be positive.")
+
         os.makedirs(PUBLIC_VIDEOS_DIR, exist_ok=True) # Ensure video directory exists
 
         current_time = datetime.datetime.now().strftime("%Y%m%d%H%M%S%f")
@@ -111,17 +149,27 @@ async def upload_video_endpoint(
 
         print(f"Locally saved uploaded video file to: {local_file_path}")
 
-        uploaded_url, public_id = upload_video_to_cloudinary(local_file_path) # Use video upload function
+        upload_path = local_file_path
+        compression = None
+        if compress:
+            compressed_file_path = f"{os.path.splitext(local_file_path)[0]}_compressed.mp4"
+            compression = await compress_video_in_pool(local_file_path, compressed_file_path, target_bitrate_kbps, max_height)
+            upload_path = compression.pop("upload_path")
+
+        uploaded_url, public_id = upload_video_to_cloudinary(upload_path) # Use video upload function
 
         if uploaded_url and public_id:
             save_metadata(new_filename_with_ext, public_id, uploaded_url, original_filename, VIDEO_METADATA_DIR) # Save to video metadata directory
+            cached = await run_in_threadpool(cache_media, public_id, upload_path)
 
             return JSONResponse(status_code=200, content={
                 "message": "Video uploaded successfully",
                 "url": uploaded_url,
                 "public_id": public_id,
                 "local_path": local_file_path,
-                "metadata_saved": True
+                "metadata_saved": True,
+                "cached": cached,
+                "compression": compression
             })
         else:
             raise HTTPException(status_code=500, detail="Cloudinary video upload failed: Check server logs for details.")
@@ -134,6 +182,23 @@ async def upload_video_endpoint(
         if local_file_path and os.path.exists(local_file_path):
             os.remove(local_file_path)
             print(f"Cleaned up local video file: {local_file_path}")
+        if compressed_file_path and os.path.exists(compressed_file_path):
+            os.remove(compressed_file_path)
+            print(f"Cleaned up compressed video file: {compressed_file_path}")
+
+@app.api_route("/media/{public_id:path}", methods=["GET", "HEAD"])
+async def serve_media_endpoint(public_id: str, request: Request):
+    entry = get_cached_media(public_id)
+    if entry:
+        response = build_media_response(entry, request.headers)
+        if response is not None:
+            return response
+        drop_cached_media(public_id)
+
+    url = media_url_index.get(public_id)
+    if not url:
+        raise HTTPException(status_code=404, detail=f"No media found for public_id '{public_id}'.")
+    return RedirectResponse(url=url, status_code=302)
 
 
 if __name__ == "__main__":
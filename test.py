@@ -1,11 +1,14 @@
 import requests
 import os
+import json
 
 SERVER_URL = "http://localhost:8998"
 UPLOAD_IMAGE_ENDPOINT = f"{SERVER_URL}/upload-image/"
 UPLOAD_VIDEO_ENDPOINT = f"{SERVER_URL}/upload-video/" # New endpoint
 TEST_IMAGE_PATH = "image.png"
 TEST_VIDEO_PATH = "video.mp4" # New test video file
+MEDIA_ENDPOINT = f"{SERVER_URL}/media"
+TEST_MISS_METADATA_PATH = "video_metadata/20250616131820303860_video.json" # Uploaded before the cache existed
 
 # --- Helper to create dummy image (if not exists) ---
 def create_dummy_image(path):
@@ -113,9 +116,118 @@ def test_upload_video():
         except Exception as e:
             print(f"An unexpected error occurred during video upload: {e}")
 
+def test_upload_video_compressed():
+    """
+    Tests the /upload-video/ endpoint with local pre-compression enabled.
+    """
+    create_dummy_video(TEST_VIDEO_PATH) # Ensure video exists before testing
+
+    print(f"\n--- Attempting to upload compressed video: {TEST_VIDEO_PATH} ---")
+
+    if not os.path.exists(TEST_VIDEO_PATH):
+        print(f"Skipping compressed video upload test: '{TEST_VIDEO_PATH}' not found.")
+        return
+
+    with open(TEST_VIDEO_PATH, "rb") as f:
+        files = {"file": (os.path.basename(TEST_VIDEO_PATH), f, "video/mp4")}
+        data = {"compress": "true", "target_bitrate_kbps": "800", "max_height": "480"}
+
+        try:
+            response = requests.post(UPLOAD_VIDEO_ENDPOINT, files=files, data=data)
+
+            print(f"Response Status Code: {response.status_code}")
+            print(f"Response Body: {response.json()}")
+
+            if response.status_code == 200:
+                print("\nCompressed video upload test successful!")
+                compression = response.json().get('compression') or {}
+                print(f"Compressed: {compression.get('compressed')} ({compression.get('reason')})")
+                print(f"Original size: {compression.get('original_size')} bytes")
+                print(f"Compressed size: {compression.get('compressed_size')} bytes")
+                print(f"Encode time: {compression.get('encode_time')}s")
+            else:
+                print("\nCompressed video upload test failed.")
+
+        except requests.exceptions.ConnectionError:
+            print(f"Error: Could not connect to the server at {SERVER_URL}.")
+            print("Please ensure your FastAPI server is running.")
+        except Exception as e:
+            print(f"An unexpected error occurred during compressed video upload: {e}")
+
+def test_media_cache():
+    """
+    Tests the /media/{public_id} endpoint. Needs the server running with MEDIA_CACHE_ENABLED=true.
+    """
+    create_dummy_video(TEST_VIDEO_PATH) # Ensure video exists before testing
+
+    print(f"\n--- Attempting to serve cached media for: {TEST_VIDEO_PATH} ---")
+
+    if not os.path.exists(TEST_VIDEO_PATH):
+        print(f"Skipping media cache test: '{TEST_VIDEO_PATH}' not found.")
+        return
+
+    def check(name, response, expected_status):
+        passed = response.status_code == expected_status
+        print(f"{'PASS' if passed else 'FAIL'} {name}: {response.status_code} (expected {expected_status})")
+        return passed
+
+    try:
+        with open(TEST_VIDEO_PATH, "rb") as f:
+            files = {"file": (os.path.basename(TEST_VIDEO_PATH), f, "video/mp4")}
+            response = requests.post(UPLOAD_VIDEO_ENDPOINT, files=files)
+
+        if response.status_code != 200 or not response.json().get('cached'):
+            print(f"Upload was not cached, is MEDIA_CACHE_ENABLED set? Response Body: {response.json()}")
+            return
+
+        public_id = response.json().get('public_id')
+        media_url = f"{MEDIA_ENDPOINT}/{public_id}"
+        file_size = os.path.getsize(TEST_VIDEO_PATH)
+        results = []
+
+        # Cache hit
+        response = requests.get(media_url, allow_redirects=False)
+        results.append(check("cache hit", response, 200) and len(response.content) == file_size)
+        etag = response.headers.get('etag')
+
+        # Conditional GET
+        response = requests.get(media_url, headers={"If-None-Match": etag}, allow_redirects=False)
+        results.append(check("If-None-Match", response, 304))
+
+        # Range request
+        response = requests.get(media_url, headers={"Range": "bytes=0-99"}, allow_redirects=False)
+        results.append(check("Range bytes=0-99", response, 206)
+                       and response.headers.get('content-range') == f"bytes 0-99/{file_size}"
+                       and len(response.content) == 100)
+        print(f"  Content-Range: {response.headers.get('content-range')}")
+
+        # Unsatisfiable range
+        response = requests.get(media_url, headers={"Range": f"bytes={file_size}-"}, allow_redirects=False)
+        results.append(check("unsatisfiable range", response, 416))
+
+        # Cache miss redirects to the stored URL
+        with open(TEST_MISS_METADATA_PATH, "r") as f:
+            miss_metadata = json.load(f)
+        response = requests.get(f"{MEDIA_ENDPOINT}/{miss_metadata['public_id']}", allow_redirects=False)
+        results.append(check("cache miss", response, 302) and response.headers.get('location') == miss_metadata['url'])
+        print(f"  Location: {response.headers.get('location')}")
+
+        if all(results):
+            print("\nMedia cache test successful!")
+        else:
+            print("\nMedia cache test failed.")
+
+    except requests.exceptions.ConnectionError:
+        print(f"Error: Could not connect to the server at {SERVER_URL}.")
+        print("Please ensure your FastAPI server is running.")
+    except Exception as e:
+        print(f"An unexpected error occurred during media cache test: {e}")
+
 
 if __name__ == "__main__":
     print("Starting server tests...")
     # test_upload_image()
     test_upload_video() # Call the new video test
+    # test_upload_video_compressed()
+    # test_media_cache()
     print("\nTests finished.")
\ No newline at end of file
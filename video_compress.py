@@ -0,0 +1,184 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dotenv import load_dotenv
+
+load_dotenv()
+
+FFMPEG_PATH = shutil.which("ffmpeg")
+FFPROBE_PATH = shutil.which("ffprobe")
+
+# CPU budget for local encoding: at most COMPRESSION_MAX_WORKERS ffmpeg jobs run at
+# once, each limited to COMPRESSION_THREADS_PER_JOB threads.
+_cpu_count = os.cpu_count() or 2
+COMPRESSION_MAX_WORKERS = max(1, int(os.getenv('COMPRESSION_MAX_WORKERS', _cpu_count // 4)))
+COMPRESSION_THREADS_PER_JOB = max(1, int(os.getenv('COMPRESSION_THREADS_PER_JOB', _cpu_count // (2 * COMPRESSION_MAX_WORKERS))))
+# A hung or very long encode would otherwise hold a pool worker forever.
+COMPRESSION_TIMEOUT_SECONDS = max(1, int(os.getenv('COMPRESSION_TIMEOUT_SECONDS', 600)))
+
+DEFAULT_TARGET_BITRATE_KBPS = 1500
+DEFAULT_MAX_HEIGHT = 720
+AUDIO_BITRATE_KBPS = 128
+
+_compression_pool = None
+
+
+def get_compression_pool() -> ProcessPoolExecutor:
+    global _compression_pool
+    if _compression_pool is None:
+        # spawn, not fork: the server process is multi-threaded by the time the pool is created
+        _compression_pool = ProcessPoolExecutor(
+            max_workers=COMPRESSION_MAX_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _compression_pool
+
+
+def shutdown_compression_pool():
+    global _compression_pool
+    if _compression_pool is not None:
+        _compression_pool.shutdown(wait=False, cancel_futures=True)
+        _compression_pool = None
+
+
+def ffmpeg_available() -> bool:
+    return FFMPEG_PATH is not None and FFPROBE_PATH is not None
+
+
+def probe_video(video_path: str) -> tuple[int | None, int | None]:
+    """Returns (bitrate in bits/s, height in pixels) of a video, or None for unknown values."""
+    try:
+        result = subprocess.run(
+            [
+                FFPROBE_PATH, "-v", "error",
+                "-select_streams", "v:0",
+                "-show_entries", "format=bit_rate:stream=height",
+                "-of", "json",
+                video_path,
+            ],
+            capture_output=True,
+            text=True,
+            timeout=30,
+            check=True,
+        )
+        probe = json.loads(result.stdout)
+        bit_rate = probe.get('format', {}).get('bit_rate')
+        streams = probe.get('streams', [])
+        height = streams[0].get('height') if streams else None
+        return (int(bit_rate) if bit_rate else None), (int(height) if height else None)
+
+    except Exception as e:
+        print(f"Could not probe video {video_path}: {e}")
+        return None, None
+
+
+def _fallback_report(input_path: str, reason: str | None = None) -> dict:
+    original_size = os.path.getsize(input_path)
+    return {
+        "compressed": False,
+        "upload_path": input_path,
+        "original_size": original_size,
+        "compressed_size": original_size,
+        "encode_time": 0.0,
+        "reason": reason,
+    }
+
+
+def compress_video(input_path: str, output_path: str, target_bitrate_kbps: int, max_height: int) -> dict:
+    """
+    Re-encodes input_path to output_path at the target bitrate, scaled down to max_height.
+    Runs inside a worker of the compression pool. The returned dict always contains the
+    path that should be uploaded, so callers can fall back to the original on any skip/failure.
+    """
+    report = _fallback_report(input_path)
+
+    if not ffmpeg_available():
+        report["reason"] = "ffmpeg not available"
+        return report
+
+    bit_rate, height = probe_video(input_path)
+    target_bps = (target_bitrate_kbps + AUDIO_BITRATE_KBPS) * 1000
+    if bit_rate is not None and bit_rate <= target_bps and (height is None or height <= max_height):
+        report["reason"] = "already below target bitrate"
+        return report
+
+    command = [
+        FFMPEG_PATH, "-y", "-v", "error",
+        "-i", input_path,
+        # libx264/yuv420p needs an even height, so round down after capping
+        "-vf", f"scale=-2:'trunc(min({max_height},ih)/2)*2'",
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-b:v", f"{target_bitrate_kbps}k",
+        "-maxrate", f"{target_bitrate_kbps}k",
+        "-bufsize", f"{target_bitrate_kbps * 2}k",
+        "-c:a", "aac",
+        "-b:a", f"{AUDIO_BITRATE_KBPS}k",
+        "-movflags", "+faststart",
+        "-threads", str(COMPRESSION_THREADS_PER_JOB),
+        output_path,
+    ]
+
+    start = time.perf_counter()
+    try:
+        subprocess.run(command, capture_output=True, text=True, check=True, timeout=COMPRESSION_TIMEOUT_SECONDS)
+        report["encode_time"] = round(time.perf_counter() - start, 3)
+        compressed_size = os.path.getsize(output_path)
+    except Exception as e:
+        report["encode_time"] = round(time.perf_counter() - start, 3)
+        if isinstance(e, subprocess.TimeoutExpired):
+            print(f"ffmpeg timed out after {COMPRESSION_TIMEOUT_SECONDS}s for {input_path}")
+            report["reason"] = "ffmpeg encode timed out"
+        elif isinstance(e, subprocess.CalledProcessError):
+            print(f"ffmpeg failed for {input_path}: {e.stderr}")
+            report["reason"] = "ffmpeg encode failed"
+        else:
+            print(f"An unexpected error occurred while compressing {input_path}: {e}")
+            report["reason"] = f"compression error: {e}"
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        return report
+
+    if compressed_size >= report["original_size"]:
+        os.remove(output_path)
+        report["reason"] = "compressed file was not smaller"
+        return report
+
+    report.update({
+        "compressed": True,
+        "upload_path": output_path,
+        "compressed_size": compressed_size,
+    })
+    print(f"Compressed {input_path}: {report['original_size']} -> {compressed_size} bytes in {report['encode_time']}s")
+    return report
+
+
+async def compress_video_in_pool(input_path: str, output_path: str, target_bitrate_kbps: int, max_height: int) -> dict:
+    global _compression_pool
+    loop = asyncio.get_running_loop()
+    pool = get_compression_pool()
+    try:
+        return await loop.run_in_executor(
+            pool,
+            compress_video,
+            input_path,
+            output_path,
+            target_bitrate_kbps,
+            max_height,
+        )
+    except BrokenProcessPool as e:
+        # A dead worker breaks the whole pool; drop it so the next request gets a fresh one.
+        print(f"Compression pool broke while compressing {input_path}: {e}")
+        if _compression_pool is pool:
+            _compression_pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        return _fallback_report(input_path, "compression worker crashed")
+    except Exception as e:
+        print(f"An unexpected error occurred while compressing {input_path}: {e}")
+        return _fallback_report(input_path, f"compression error: {e}")